@@ -4,12 +4,86 @@ Handles model loading and embedding generation using OpenCLIP ViT-B/32
 """
 
 import io
+import os
+import inspect
+import hashlib
+import functools
 import torch
+import torch.nn.functional as F
+import threading
 import open_clip
 from PIL import Image
-from typing import Optional, Literal
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Literal, Union
 import numpy as np
 
+# Optional libjpeg-turbo fast path for JPEG decoding (PyTurboJPEG)
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB
+    _turbo_jpeg = TurboJPEG()
+except Exception:  # Package or libturbojpeg shared library not installed
+    _turbo_jpeg = None
+
+JPEG_MAGIC = b"\xff\xd8\xff"
+
+
+# Max number of text embeddings kept in the in-memory LRU cache
+TEXT_CACHE_SIZE = 4096
+
+# Max number of tokenized strings kept in the in-memory LRU cache
+TOKEN_CACHE_SIZE = 8192
+
+# Minimum cosine similarity between int8 and FP32 text embeddings on the
+# golden set, and between int8 single-text and batched embeddings, for the
+# quantized text encoder to be kept (CPU only)
+QUANTIZATION_MIN_COSINE = 0.99
+QUANTIZATION_GOLDEN_TEXTS = [
+    "pepe frog meme",
+    "A digital art card featuring a green frog, with emphasis on visual style and composition",
+    "A digital art card depicting bitcoin and rare pepes, focused on the subject matter and themes",
+    "FREEDOMKEK",
+]
+
+# Serve the encoders through ONNX Runtime instead of PyTorch (falls back to PyTorch on failure)
+USE_ONNX = os.getenv("EMBEDDING_USE_ONNX", "false").lower() == "true"
+ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", os.path.join(os.path.dirname(__file__), "onnx"))
+
+# Content-addressed on-disk cache for the batch indexing pipeline
+IMAGE_CACHE_DIR = os.getenv(
+    "EMBEDDING_IMAGE_CACHE_DIR", os.path.join(os.path.dirname(__file__), "cache")
+)
+
+
+class _EncoderModule(torch.nn.Module):
+    """Exposes one CLIP encoder method as forward() for ONNX export"""
+    
+    def __init__(self, model, method: str):
+        super().__init__()
+        self.model = model
+        self.method = method
+    
+    def forward(self, x):
+        return getattr(self.model, self.method)(x)
+
+
+class OnnxClipModel:
+    """
+    Drop-in replacement for the CLIP model's encode_image/encode_text
+    backed by ONNX Runtime sessions (one per encoder, safe for concurrent use)
+    """
+    
+    def __init__(self, image_session, text_session):
+        self.image_session = image_session
+        self.text_session = text_session
+    
+    def encode_image(self, images: torch.Tensor) -> torch.Tensor:
+        output = self.image_session.run(None, {"input": images.cpu().numpy()})[0]
+        return torch.from_numpy(output)
+    
+    def encode_text(self, tokens: torch.Tensor) -> torch.Tensor:
+        output = self.text_session.run(None, {"input": tokens.cpu().numpy()})[0]
+        return torch.from_numpy(output)
+
 
 class EmbeddingService:
     """
@@ -23,9 +97,30 @@ class EmbeddingService:
         self.preprocess = None
         self.tokenizer = None
         self.device = None
+        self.input_device = None  # Where forward inputs go (CPU for ONNX Runtime)
+        self.dtype = torch.float32
         self.model_name = "ViT-B-32"
         self.pretrained = "laion2b_s34b_b79k"  # More reliable than 'openai'
         self.embedding_dim = 512
+        self.image_size = 224
+        
+        # CUDA graphs for fixed-shape single-item forwards (see _capture_cuda_graphs)
+        self._image_graph = None
+        self._text_graph = None
+        self._graph_lock = threading.Lock()
+        
+        # Thread pool for batch image decode/preprocess (PIL releases the GIL)
+        self._preproc_pool = ThreadPoolExecutor(max_workers=os.cpu_count())
+        
+        # LRU cache of text embeddings keyed by the exact (template-applied) text
+        self._encode_text_cached = functools.lru_cache(maxsize=TEXT_CACHE_SIZE)(
+            self._encode_text_uncached
+        )
+        
+        # LRU cache of BPE tokenizer output (CPU tensors) keyed by text
+        self._tokenize_cached = functools.lru_cache(maxsize=TOKEN_CACHE_SIZE)(
+            self._tokenize
+        )
         
         # Load model on initialization
         self._load_model()
@@ -38,6 +133,7 @@ class EmbeddingService:
             # Determine device (GPU if available, otherwise CPU)
             self.device = "cuda" if torch.cuda.is_available() else "cpu"
             print(f"   Using device: {self.device}")
+            self.input_device = self.device
             
             # Load model
             self.model, _, self.preprocess = open_clip.create_model_and_transforms(
@@ -52,6 +148,23 @@ class EmbeddingService:
             # Set model to evaluation mode
             self.model.eval()
             
+            # Use half precision on GPU (FP16 is slower on CPU)
+            if self.device == "cuda":
+                self.dtype = torch.float16
+                self.model = self.model.half()
+            
+            # Quantize the text encoder to int8 on CPU (the ONNX export needs FP32 weights)
+            if self.device == "cpu" and not USE_ONNX:
+                self._quantize_text_encoder()
+            
+            # Serve through ONNX Runtime if enabled, otherwise compile the
+            # PyTorch model to remove per-call Python dispatch overhead.
+            # Single-item forwards on GPU then replay manually captured CUDA graphs.
+            if not (USE_ONNX and self._load_onnx_model()):
+                self._compile_model()
+                if self.device == "cuda":
+                    self._capture_cuda_graphs()
+            
             print(f"✅ CLIP model loaded successfully")
             print(f"   Embedding dimension: {self.embedding_dim}")
             
@@ -59,6 +172,264 @@ class EmbeddingService:
             print(f"❌ Failed to load CLIP model: {e}")
             raise
     
+    def _quantize_text_encoder(self):
+        """
+        Apply dynamic int8 quantization to the text transformer's MLP Linear layers
+        
+        The image encoder stays FP32. Attention projections are left alone since
+        MultiheadAttention reads their weights directly. Keeps FP32 if embeddings
+        on the golden set drift below QUANTIZATION_MIN_COSINE.
+        
+        Dynamic quantization picks one activation scale per input tensor, so a
+        text's int8 embedding depends slightly on the other texts in its batch
+        (/embed/text and /embed/batch can differ at the ~1e-3 cosine level).
+        The golden set is also checked single vs batched against the same bound.
+        """
+        try:
+            tokens = self.tokenizer(QUANTIZATION_GOLDEN_TEXTS).to(self.device)
+            
+            with torch.no_grad():
+                reference = self.model.encode_text(tokens, normalize=True)
+                
+                qconfig_spec = {
+                    f"transformer.resblocks.{i}.mlp": torch.ao.quantization.default_dynamic_qconfig
+                    for i in range(len(self.model.transformer.resblocks))
+                }
+                quantized_model = torch.ao.quantization.quantize_dynamic(
+                    self.model, qconfig_spec, dtype=torch.qint8
+                )
+                
+                # OpenCLIP infers the cast dtype from the (now packed) c_fc weight
+                quantized_model.transformer.get_cast_dtype = lambda: torch.float32
+                
+                quantized = quantized_model.encode_text(tokens, normalize=True)
+                quantized_single = torch.cat([
+                    quantized_model.encode_text(tokens[i:i + 1], normalize=True)
+                    for i in range(len(tokens))
+                ])
+            
+            min_cosine = (reference * quantized).sum(dim=-1).min().item()
+            min_batch_cosine = (quantized_single * quantized).sum(dim=-1).min().item()
+            
+            if min_cosine < QUANTIZATION_MIN_COSINE:
+                print(f"⚠️  Int8 text encoder drifted (min cosine {min_cosine:.4f}), keeping FP32")
+                return
+            
+            if min_batch_cosine < QUANTIZATION_MIN_COSINE:
+                print(f"⚠️  Int8 text embeddings vary with batch contents "
+                      f"(min cosine {min_batch_cosine:.4f}), keeping FP32")
+                return
+            
+            self.model = quantized_model
+            print(f"   Text encoder quantized to int8 (min cosine {min_cosine:.4f}, "
+                  f"single vs batch {min_batch_cosine:.4f})")
+            
+        except Exception as e:
+            print(f"⚠️  Text encoder quantization failed, keeping FP32: {e}")
+    
+    def _compile_model(self) -> bool:
+        """
+        Compile the encoders for faster inference
+        
+        Uses torch.compile on CUDA and TorchScript tracing on CPU. Runs warmup
+        forwards at batch sizes 1 and 2 (single items are specialized, larger
+        batches share one dynamic-shape graph) so neither the first single nor
+        the first batch request pays the compilation cost. Falls back to eager
+        mode if compilation fails.
+        
+        torch.compile's own CUDA graphs ("reduce-overhead") are per-thread and
+        assert off the main thread on older PyTorch, while requests run in a
+        worker pool; single-item graphs come from _capture_cuda_graphs instead.
+        
+        Returns:
+            True if the compiled model is active, False if using eager mode
+        """
+        eager_model = self.model
+        dummy_image = torch.zeros(
+            1, 3, self.image_size, self.image_size, device=self.device, dtype=self.dtype
+        )
+        dummy_tokens = torch.zeros(1, 77, dtype=torch.long, device=self.device)
+        
+        try:
+            with torch.no_grad():
+                if self.device == "cuda":
+                    # Compile the encoder methods (torch.compile on the module only covers forward)
+                    self.model.encode_image = torch.compile(
+                        self.model.encode_image, dynamic=True, fullgraph=False
+                    )
+                    self.model.encode_text = torch.compile(
+                        self.model.encode_text, dynamic=True, fullgraph=False
+                    )
+                else:
+                    self.model = torch.jit.trace_module(
+                        self.model,
+                        {"encode_image": dummy_image, "encode_text": dummy_tokens}
+                    )
+                
+                # Warmup forwards to trigger compilation for single items and batches
+                for batch_size in (1, 2):
+                    self.model.encode_image(dummy_image.repeat(batch_size, 1, 1, 1))
+                    self.model.encode_text(dummy_tokens.repeat(batch_size, 1))
+            
+            print(f"   Model compiled ({'torch.compile' if self.device == 'cuda' else 'TorchScript'})")
+            return True
+            
+        except Exception as e:
+            print(f"⚠️  Model compilation failed, using eager mode: {e}")
+            # Drop any compiled method overrides set on the instance
+            eager_model.__dict__.pop("encode_image", None)
+            eager_model.__dict__.pop("encode_text", None)
+            self.model = eager_model
+            return False
+    
+    def _capture_cuda_graphs(self):
+        """
+        Capture the single-image (1x3x224x224) and single-text (1x77) forwards
+        as CUDA graphs so each request replays all kernels with one launch
+        
+        Requests copy into static input buffers and clone the static output
+        (serialized by _graph_lock, so safe from any worker thread); other
+        batch sizes run through the model directly.
+        """
+        try:
+            image_input = torch.zeros(
+                1, 3, self.image_size, self.image_size, device=self.device, dtype=self.dtype
+            )
+            text_input = torch.zeros(1, 77, dtype=torch.long, device=self.device)
+            
+            with torch.no_grad():
+                # Warm up on a side stream before capture
+                stream = torch.cuda.Stream()
+                stream.wait_stream(torch.cuda.current_stream())
+                with torch.cuda.stream(stream):
+                    for _ in range(3):
+                        self.model.encode_image(image_input)
+                        self.model.encode_text(text_input)
+                torch.cuda.current_stream().wait_stream(stream)
+                
+                image_graph = torch.cuda.CUDAGraph()
+                with torch.cuda.graph(image_graph):
+                    image_output = self.model.encode_image(image_input)
+                
+                text_graph = torch.cuda.CUDAGraph()
+                with torch.cuda.graph(text_graph):
+                    text_output = self.model.encode_text(text_input)
+            
+            self._image_graph = (image_graph, image_input, image_output)
+            self._text_graph = (text_graph, text_input, text_output)
+            print("   Captured CUDA graphs for single-item forwards")
+            
+        except Exception as e:
+            print(f"⚠️  CUDA graph capture failed, using eager mode: {e}")
+            self._image_graph = None
+            self._text_graph = None
+    
+    def _replay_graph(self, graph_entry, inputs: torch.Tensor) -> torch.Tensor:
+        """Run a captured CUDA graph on new inputs (serialized: buffers are shared)"""
+        graph, static_input, static_output = graph_entry
+        
+        with self._graph_lock:
+            static_input.copy_(inputs)
+            graph.replay()
+            return static_output.clone()
+    
+    def _forward_text(self, tokens: torch.Tensor) -> torch.Tensor:
+        """Text encoder forward, replaying the CUDA graph for single items"""
+        if self._text_graph is not None and tokens.shape[0] == 1:
+            return self._replay_graph(self._text_graph, tokens)
+        return self.model.encode_text(tokens)
+    
+    def _forward_image(self, images: torch.Tensor) -> torch.Tensor:
+        """Image encoder forward, replaying the CUDA graph for single items"""
+        if self._image_graph is not None and images.shape[0] == 1:
+            return self._replay_graph(self._image_graph, images)
+        return self.model.encode_image(images)
+    
+    def _load_onnx_model(self) -> bool:
+        """
+        Export both encoders to ONNX (once, cached on disk) and swap the model
+        for ONNX Runtime sessions
+        
+        Returns:
+            True if the ONNX model is active, False to fall back to PyTorch
+        """
+        try:
+            import onnxruntime as ort
+            
+            os.makedirs(ONNX_DIR, exist_ok=True)
+            prefix = f"{self.model_name}_{self.pretrained}_{str(self.dtype).split('.')[-1]}"
+            
+            dummy_inputs = {
+                "encode_image": torch.zeros(
+                    1, 3, self.image_size, self.image_size, device=self.device, dtype=self.dtype
+                ),
+                "encode_text": torch.zeros(1, 77, dtype=torch.long, device=self.device),
+            }
+            
+            # Newer PyTorch defaults to the dynamo exporter; keep the TorchScript one
+            export_kwargs = {}
+            if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+                export_kwargs["dynamo"] = False
+            
+            providers = ["CPUExecutionProvider"]
+            if self.device == "cuda":
+                providers.insert(0, "CUDAExecutionProvider")
+            
+            sessions = {}
+            for method, dummy in dummy_inputs.items():
+                path = os.path.join(ONNX_DIR, f"{prefix}_{method}.onnx")
+                
+                if not os.path.exists(path):
+                    print(f"   Exporting {method} to ONNX: {path}")
+                    
+                    # Export to a temp file so an interrupted export never
+                    # leaves a truncated model at the cached path
+                    tmp_path = f"{path}.{os.getpid()}.tmp"
+                    try:
+                        torch.onnx.export(
+                            _EncoderModule(self.model, method),
+                            (dummy,),
+                            tmp_path,
+                            input_names=["input"],
+                            output_names=["output"],
+                            dynamic_axes={"input": {0: "batch"}, "output": {0: "batch"}},
+                            opset_version=17,
+                            **export_kwargs
+                        )
+                        os.replace(tmp_path, path)
+                    finally:
+                        if os.path.exists(tmp_path):
+                            os.remove(tmp_path)
+                
+                sessions[method] = ort.InferenceSession(path, providers=providers)
+            
+            self.model = OnnxClipModel(sessions["encode_image"], sessions["encode_text"])
+            
+            # Sessions take numpy inputs (ORT does its own host-to-device copy),
+            # so keep inputs on CPU rather than round-tripping through the GPU
+            self.input_device = "cpu"
+            print(f"   Using ONNX Runtime ({sessions['encode_image'].get_providers()[0]})")
+            return True
+            
+        except Exception as e:
+            print(f"⚠️  ONNX Runtime setup failed, using PyTorch: {e}")
+            return False
+    
+    def _to_device(self, tensor: torch.Tensor) -> torch.Tensor:
+        """
+        Move a CPU input tensor to the input device and model dtype
+        
+        On GPU the copy is made from pinned memory with non_blocking=True so it
+        overlaps with queued kernels; the forward that follows runs on the same
+        (default) stream, so ordering is preserved.
+        """
+        if self.input_device == "cuda":
+            if not tensor.is_pinned():
+                tensor = tensor.pin_memory()
+            return tensor.to(self.input_device, dtype=self.dtype, non_blocking=True)
+        
+        return tensor.to(self.input_device, dtype=self.dtype)
+    
     def is_loaded(self) -> bool:
         """Check if model is loaded and ready"""
         return self.model is not None
@@ -92,73 +463,245 @@ class EmbeddingService:
     
     def encode_text(self, text: str) -> np.ndarray:
         """
-        Generate embedding for text input
+        Generate embedding for text input (cached)
         
         Args:
             text: Text string to embed
         
         Returns:
-            512-dimensional embedding as numpy array
+            512-dimensional embedding as read-only numpy array
         """
-        if not self.is_loaded():
-            raise RuntimeError("Model not loaded")
-        
+        return self._encode_text_cached(text)
+    
+    def _tokenize(self, text: str) -> torch.Tensor:
+        """Tokenize a single string into a 1x77 CPU tensor"""
+        return self.tokenizer([text])
+    
+    def _encode_text_uncached(self, text: str) -> np.ndarray:
+        """Run the text encoder for a single string"""
+        # Tokenize text
         try:
-            # Tokenize text
-            tokens = self.tokenizer([text]).to(self.device)
-            
-            # Generate embedding
-            with torch.no_grad():
-                text_features = self.model.encode_text(tokens)
-                
-                # Normalize to unit vector (for cosine similarity)
-                text_features = text_features / text_features.norm(dim=-1, keepdim=True)
-            
-            # Convert to numpy array
-            embedding = text_features.cpu().numpy()[0]
-            
-            return embedding
+            tokens = self._tokenize_cached(text).to(self.input_device)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Text tokenization failed: {e}") from e
+        
+        # Generate embedding
+        with torch.no_grad():
+            text_features = self._forward_text(tokens).float()
             
-        except Exception as e:
-            raise RuntimeError(f"Text encoding failed: {e}")
+            # Normalize to unit vector (for cosine similarity, in FP32 for precision)
+            text_features = F.normalize(text_features, dim=-1)
+        
+        # Convert to numpy array (read-only, since it is shared via the cache)
+        embedding = text_features.cpu().numpy()[0]
+        embedding.setflags(write=False)
+        
+        return embedding
     
-    def encode_image(self, image_bytes: bytes) -> np.ndarray:
+    def image_cache_key(self, image_bytes: bytes) -> str:
+        """Content hash used to key the on-disk image caches"""
+        return hashlib.sha256(image_bytes).hexdigest()
+    
+    def _cache_path(self, kind: str, key: str) -> str:
+        return os.path.join(IMAGE_CACHE_DIR, kind, f"{key}.npy")
+    
+    def _preprocess_config_tag(self) -> str:
+        # Tensors depend on the transforms (size, interpolation, normalization)
+        # and on which JPEG decoder produced the pixels
+        # (plain functions by name, since their repr holds a per-process address)
+        transforms = getattr(self.preprocess, "transforms", [self.preprocess])
+        decoder = "turbo" if _turbo_jpeg is not None else "pil"
+        config = "|".join(
+            [t.__qualname__ if inspect.isfunction(t) else repr(t) for t in transforms] + [decoder]
+        )
+        return hashlib.sha256(config.encode()).hexdigest()[:16]
+    
+    def _embedding_cache_kind(self) -> str:
+        # Embeddings also depend on the weights, precision and inference backend
+        dtype = str(self.dtype).split(".")[-1]
+        backend = "onnx" if isinstance(self.model, OnnxClipModel) else "torch"
+        return (
+            f"embeddings_{self.model_name}_{self.pretrained}_{dtype}_{backend}"
+            f"_{self._preprocess_config_tag()}"
+        )
+    
+    def _preprocessed_cache_kind(self) -> str:
+        return f"preprocessed_{self._preprocess_config_tag()}"
+    
+    def _load_cached_array(self, kind: str, key: str) -> Optional[np.ndarray]:
+        """Load a cached array, treating missing or unreadable files as a miss"""
+        try:
+            return np.load(self._cache_path(kind, key))
+        except (OSError, ValueError):
+            return None
+    
+    def _save_cached_array(self, kind: str, key: str, array: np.ndarray):
+        """Write a cached array atomically; cache write failures are non-fatal"""
+        path = self._cache_path(kind, key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️  Failed to write cache file {path}: {e}")
+    
+    def load_cached_image_embedding(self, key: str) -> Optional[np.ndarray]:
+        """Look up a previously computed image embedding by content hash"""
+        return self._load_cached_array(self._embedding_cache_kind(), key)
+    
+    def save_cached_image_embedding(self, key: str, embedding: np.ndarray):
+        """Store an image embedding by content hash"""
+        self._save_cached_array(self._embedding_cache_kind(), key, embedding)
+    
+    def load_cached_image_embeddings(
+        self,
+        images: list[bytes]
+    ) -> tuple[list[str], list[Optional[np.ndarray]]]:
         """
-        Generate embedding for image input
+        Hash each image and look up its cached embedding (blocking; run off the event loop)
+        
+        Returns:
+            Content hashes and cached embeddings (None on a miss), in input order
+        """
+        keys = [self.image_cache_key(image_bytes) for image_bytes in images]
+        return keys, [self.load_cached_image_embedding(key) for key in keys]
+    
+    def save_cached_image_embeddings(self, keys: list[str], embeddings: list[np.ndarray]):
+        """Store image embeddings by content hash (blocking; run off the event loop)"""
+        for key, embedding in zip(keys, embeddings):
+            self.save_cached_image_embedding(key, embedding)
+    
+    def preprocess_image(self, image_bytes: bytes, cache_key: Optional[str] = None) -> torch.Tensor:
+        """
+        Decode image bytes and apply CLIP preprocessing transforms
         
         Args:
             image_bytes: Raw image bytes (PNG, JPG, GIF)
+            cache_key: Content hash; when given, the preprocessed tensor is
+                read from / written to the on-disk cache
         
         Returns:
-            512-dimensional embedding as numpy array
+            Preprocessed 3x224x224 image tensor (on CPU)
         """
-        if not self.is_loaded():
-            raise RuntimeError("Model not loaded")
+        if cache_key is not None:
+            cached = self._load_cached_array(self._preprocessed_cache_kind(), cache_key)
+            if cached is not None:
+                return torch.from_numpy(cached).float()
         
-        try:
-            # Load image from bytes
+        # Load image from bytes (JPEGs via libjpeg-turbo when available)
+        image = None
+        if _turbo_jpeg is not None and image_bytes[:3] == JPEG_MAGIC:
+            image = self._decode_jpeg_turbo(image_bytes)
+        
+        if image is None:
             image = Image.open(io.BytesIO(image_bytes))
             
+            # Let the JPEG decoder downscale in the DCT domain (no-op for other formats).
+            # Output stays >= the model input size, so Resize still does the final step.
+            image.draft("RGB", (self.image_size, self.image_size))
+            
             # Convert to RGB (handles RGBA, grayscale, etc.)
             image = image.convert("RGB")
+        
+        # Apply preprocessing transforms
+        image_tensor = self.preprocess(image)
+        
+        if cache_key is not None:
+            self._save_cached_array(
+                self._preprocessed_cache_kind(), cache_key,
+                image_tensor.numpy().astype(np.float16)
+            )
+        
+        return image_tensor
+    
+    def _decode_jpeg_turbo(self, image_bytes: bytes) -> Optional[Image.Image]:
+        """
+        Decode a JPEG with libjpeg-turbo, downscaling during decode by the same
+        1/2, 1/4 or 1/8 factor Image.draft() picks, so embeddings don't depend
+        on whether PyTurboJPEG is installed
+        
+        Returns:
+            RGB image, or None to fall back to PIL
+        """
+        try:
+            width, height = _turbo_jpeg.decode_header(image_bytes)[:2]
             
-            # Apply preprocessing transforms
-            image_tensor = self.preprocess(image).unsqueeze(0).to(self.device)
-            
-            # Generate embedding
-            with torch.no_grad():
-                image_features = self.model.encode_image(image_tensor)
-                
-                # Normalize to unit vector (for cosine similarity)
-                image_features = image_features / image_features.norm(dim=-1, keepdim=True)
+            # Draft's rule: largest power of two <= the whole-number downscale ratio
+            scale = min(width // self.image_size, height // self.image_size)
+            denom = next((d for d in (8, 4, 2) if scale >= d), 1)
+            scaling_factor = (1, denom) if denom > 1 else None
             
-            # Convert to numpy array
-            embedding = image_features.cpu().numpy()[0]
+            pixels = _turbo_jpeg.decode(
+                image_bytes, pixel_format=TJPF_RGB, scaling_factor=scaling_factor
+            )
+            return Image.fromarray(pixels)
             
-            return embedding
+        except Exception:
+            return None
+    
+    def preprocess_images(
+        self,
+        images: list[bytes],
+        cache_keys: Optional[list[str]] = None
+    ) -> list[Union[torch.Tensor, Exception]]:
+        """
+        Decode and preprocess multiple images in parallel
+        
+        Args:
+            images: List of raw image bytes
+            cache_keys: Optional content hashes (one per image) for the on-disk cache
+        
+        Returns:
+            List of preprocessed tensors in input order; items that failed to
+            decode hold the raised exception instead
+        """
+        cache_keys = cache_keys or [None] * len(images)
+        futures = [
+            self._preproc_pool.submit(self.preprocess_image, b, key)
+            for b, key in zip(images, cache_keys)
+        ]
+        
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        
+        return results
+    
+    def encode_image(self, image_bytes: bytes) -> np.ndarray:
+        """
+        Generate embedding for image input
+        
+        Args:
+            image_bytes: Raw image bytes (PNG, JPG, GIF)
+        
+        Returns:
+            512-dimensional embedding as numpy array
+        """
+        # Decode and preprocess
+        try:
+            image_tensor = self.preprocess_image(image_bytes)
+        except (OSError, ValueError) as e:
+            raise ValueError(f"Image decoding failed: {e}") from e
+        
+        image_tensor = self._to_device(image_tensor.unsqueeze(0))
+        
+        # Generate embedding
+        with torch.no_grad():
+            image_features = self._forward_image(image_tensor).float()
             
-        except Exception as e:
-            raise RuntimeError(f"Image encoding failed: {e}")
+            # Normalize to unit vector (for cosine similarity, in FP32 for precision)
+            image_features = F.normalize(image_features, dim=-1)
+        
+        # Convert to numpy array
+        embedding = image_features.cpu().numpy()[0]
+        
+        return embedding
     
     def encode_batch_text(self, texts: list[str]) -> list[np.ndarray]:
         """
@@ -170,27 +713,59 @@ class EmbeddingService:
         Returns:
             List of 512-dimensional embeddings
         """
-        if not self.is_loaded():
-            raise RuntimeError("Model not loaded")
-        
+        # Tokenize all texts
         try:
-            # Tokenize all texts
-            tokens = self.tokenizer(texts).to(self.device)
-            
-            # Generate embeddings
-            with torch.no_grad():
-                text_features = self.model.encode_text(tokens)
-                
-                # Normalize each vector
-                text_features = text_features / text_features.norm(dim=-1, keepdim=True)
-            
-            # Convert to list of numpy arrays
-            embeddings = [feat.cpu().numpy() for feat in text_features]
+            tokens = torch.cat([self._tokenize_cached(text) for text in texts]).to(self.input_device)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Batch text tokenization failed: {e}") from e
+        
+        # Generate embeddings
+        with torch.no_grad():
+            text_features = self._forward_text(tokens).float()
             
-            return embeddings
+            # Normalize each vector
+            text_features = F.normalize(text_features, dim=-1)
+        
+        # Convert to list of numpy arrays (one device-to-host copy, rows are views)
+        features = text_features.contiguous().cpu().numpy()
+        embeddings = list(features)
+        
+        return embeddings
+    
+    def encode_batch_images(self, image_tensors: list[torch.Tensor]) -> list[np.ndarray]:
+        """
+        Generate embeddings for multiple preprocessed images in one forward pass
+        
+        Args:
+            image_tensors: List of tensors from preprocess_image()
+        
+        Returns:
+            List of 512-dimensional embeddings
+        """
+        # Stack into a single batch tensor (directly into pinned memory on GPU)
+        if self.input_device == "cuda":
+            batch = torch.empty(
+                (len(image_tensors), 3, self.image_size, self.image_size),
+                pin_memory=True
+            )
+            torch.stack(image_tensors, out=batch)
+        else:
+            batch = torch.stack(image_tensors)
+        
+        batch = self._to_device(batch)
+        
+        # Generate embeddings
+        with torch.no_grad():
+            image_features = self._forward_image(batch).float()
             
-        except Exception as e:
-            raise RuntimeError(f"Batch text encoding failed: {e}")
+            # Normalize each vector
+            image_features = F.normalize(image_features, dim=-1)
+        
+        # Convert to list of numpy arrays (one device-to-host copy, rows are views)
+        features = image_features.contiguous().cpu().numpy()
+        embeddings = list(features)
+        
+        return embeddings
     
     def validate_embedding(self, embedding: np.ndarray) -> bool:
         """
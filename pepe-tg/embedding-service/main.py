@@ -3,12 +3,19 @@ CLIP Embedding Service
 FastAPI microservice for generating image and text embeddings using OpenCLIP ViT-B/32
 """
 
+import os
 import time
+import base64
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import datetime
 from typing import Optional
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import Depends, FastAPI, File, Form, Request, UploadFile, HTTPException
 from fastapi.responses import JSONResponse
+import numpy as np
 import uvicorn
+import torch
 
 from models import (
     TextEmbeddingRequest,
@@ -17,27 +24,73 @@ from models import (
     BatchEmbeddingRequest,
     BatchEmbeddingResponse,
     HealthResponse,
-    ErrorResponse
+    ErrorResponse,
+    EmbeddingFormat
 )
-from embedding import EmbeddingService
+from embedding import EmbeddingService, get_embedding_service
+
+# Model concurrency limits (sized to the device at startup).
+# Blocking model calls run in a matching worker pool to keep the event loop free.
+_model_semaphore: Optional[asyncio.Semaphore] = None
+_model_pool: Optional[ThreadPoolExecutor] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Load the shared embedding service (CLIP model) once at startup"""
+    global _model_semaphore, _model_pool
+    
+    service = get_embedding_service()
+    app.state.embedding_service = service
+    
+    # Limit concurrent model forwards so requests don't fight over CPU cores
+    torch.set_num_threads(os.cpu_count())
+    concurrency = 1 if service.device == "cpu" else 4
+    _model_semaphore = asyncio.Semaphore(concurrency)
+    _model_pool = ThreadPoolExecutor(max_workers=concurrency)
+    
+    yield
+    
+    _model_pool.shutdown(wait=False)
+
 
 # Initialize FastAPI app
 app = FastAPI(
     title="CLIP Embedding Service",
     description="Local microservice for generating CLIP embeddings for visual and textual card search",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-# Initialize embedding service (loads CLIP model)
-embedding_service = EmbeddingService()
-
 # Request counter for monitoring
 request_counter = 0
 last_request_time: Optional[datetime] = None
 
 
+def get_service(http_request: Request) -> EmbeddingService:
+    """Dependency returning the embedding service loaded at startup"""
+    return http_request.app.state.embedding_service
+
+
+async def run_model(func, *args):
+    """Run a blocking model call in the worker pool, bounded by the model semaphore"""
+    async with _model_semaphore:
+        return await asyncio.get_running_loop().run_in_executor(_model_pool, func, *args)
+
+
+def serialize_embedding(embedding: np.ndarray, format: EmbeddingFormat) -> dict:
+    """Serialize an embedding as a float list or base64 float16 bytes"""
+    if format == "f16_b64":
+        return {
+            "embedding": None,
+            "embedding_b64": base64.b64encode(embedding.astype(np.float16).tobytes()).decode()
+        }
+    
+    return {"embedding": embedding.tolist(), "embedding_b64": None}
+
+
 @app.get("/health", response_model=HealthResponse)
-async def health_check():
+async def health_check(embedding_service: EmbeddingService = Depends(get_service)):
     """Health check endpoint - returns service status and model readiness"""
     global request_counter, last_request_time
     
@@ -54,7 +107,10 @@ async def health_check():
 
 
 @app.post("/embed/text", response_model=TextEmbeddingResponse)
-async def embed_text(request: TextEmbeddingRequest):
+async def embed_text(
+    request: TextEmbeddingRequest,
+    embedding_service: EmbeddingService = Depends(get_service)
+):
     """
     Generate text embedding from input string
     
@@ -72,7 +128,7 @@ async def embed_text(request: TextEmbeddingRequest):
         )
         
         # Generate embedding
-        embedding = embedding_service.encode_text(processed_text)
+        embedding = await run_model(embedding_service.encode_text, processed_text)
         
         # Update metrics
         request_counter += 1
@@ -81,7 +137,7 @@ async def embed_text(request: TextEmbeddingRequest):
         processing_time = (time.time() - start_time) * 1000  # Convert to ms
         
         return TextEmbeddingResponse(
-            embedding=embedding.tolist(),
+            **serialize_embedding(embedding, request.format),
             model=embedding_service.model_name,
             processing_time_ms=processing_time,
             processed_text=processed_text
@@ -95,7 +151,11 @@ async def embed_text(request: TextEmbeddingRequest):
 
 
 @app.post("/embed/image", response_model=ImageEmbeddingResponse)
-async def embed_image(file: UploadFile = File(...)):
+async def embed_image(
+    file: UploadFile = File(...),
+    format: EmbeddingFormat = Form("json"),
+    embedding_service: EmbeddingService = Depends(get_service)
+):
     """
     Generate image embedding from uploaded file
     
@@ -118,7 +178,7 @@ async def embed_image(file: UploadFile = File(...)):
         image_bytes = await file.read()
         
         # Generate embedding
-        embedding = embedding_service.encode_image(image_bytes)
+        embedding = await run_model(embedding_service.encode_image, image_bytes)
         
         # Update metrics
         request_counter += 1
@@ -127,7 +187,7 @@ async def embed_image(file: UploadFile = File(...)):
         processing_time = (time.time() - start_time) * 1000  # Convert to ms
         
         return ImageEmbeddingResponse(
-            embedding=embedding.tolist(),
+            **serialize_embedding(embedding, format),
             model=embedding_service.model_name,
             processing_time_ms=processing_time
         )
@@ -140,7 +200,10 @@ async def embed_image(file: UploadFile = File(...)):
 
 
 @app.post("/embed/batch", response_model=BatchEmbeddingResponse)
-async def embed_batch(request: BatchEmbeddingRequest):
+async def embed_batch(
+    request: BatchEmbeddingRequest,
+    embedding_service: EmbeddingService = Depends(get_service)
+):
     """
     Batch embedding endpoint for indexing pipeline
     
@@ -151,49 +214,99 @@ async def embed_batch(request: BatchEmbeddingRequest):
     start_time = time.time()
     
     try:
-        embeddings = []
-        successful = 0
-        failed = 0
-        
-        for item in request.items:
-            try:
-                if request.type == "text":
-                    embedding = embedding_service.encode_text(item.get("text", ""))
-                    embeddings.append({
-                        "id": item.get("id"),
-                        "embedding": embedding.tolist(),
-                        "success": True,
-                        "error": None
-                    })
-                    successful += 1
-                    
-                elif request.type == "image":
+        embeddings = [None] * len(request.items)
+        batch_indices = []
+        
+        if request.type == "text":
+            texts = [item.text or "" for item in request.items]
+            batch_indices = list(range(len(texts)))
+            batch_embeddings = await run_model(embedding_service.encode_batch_text, texts) if texts else []
+            
+        else:
+            # Read each image up front so one bad item doesn't fail the whole batch
+            image_bytes_list = []
+            read_indices = []
+            
+            for i, item in enumerate(request.items):
+                try:
                     # For batch, items should include local file paths
                     # (server-side only, not exposed via network)
-                    path = item.get("path")
-                    if not path:
+                    if not item.path:
                         raise ValueError("Missing 'path' for image batch item")
                     
-                    with open(path, 'rb') as f:
-                        image_bytes = f.read()
+                    with open(item.path, 'rb') as f:
+                        image_bytes_list.append(f.read())
+                    read_indices.append(i)
                     
-                    embedding = embedding_service.encode_image(image_bytes)
-                    embeddings.append({
-                        "id": item.get("id"),
-                        "embedding": embedding.tolist(),
+                except Exception as e:
+                    embeddings[i] = {
+                        "id": item.id,
+                        "embedding": None,
+                        "success": False,
+                        "error": str(e)
+                    }
+            
+            # Reuse embeddings for unchanged images (keyed by content hash)
+            loop = asyncio.get_running_loop()
+            keys, cached_embeddings = await loop.run_in_executor(
+                None, embedding_service.load_cached_image_embeddings, image_bytes_list
+            )
+            
+            cache_keys = []
+            pending_indices = []
+            pending_bytes = []
+            
+            for i, image_bytes, key, cached in zip(read_indices, image_bytes_list, keys, cached_embeddings):
+                if cached is not None:
+                    embeddings[i] = {
+                        "id": request.items[i].id,
+                        **serialize_embedding(cached, request.format),
                         "success": True,
                         "error": None
-                    })
-                    successful += 1
-                    
-            except Exception as e:
-                embeddings.append({
-                    "id": item.get("id"),
-                    "embedding": None,
-                    "success": False,
-                    "error": str(e)
-                })
-                failed += 1
+                    }
+                else:
+                    cache_keys.append(key)
+                    pending_indices.append(i)
+                    pending_bytes.append(image_bytes)
+            
+            # Decode and preprocess in parallel, dropping items that fail
+            image_tensors = []
+            tensor_keys = []
+            preprocessed = await loop.run_in_executor(
+                None, embedding_service.preprocess_images, pending_bytes, cache_keys
+            )
+            
+            for i, key, result in zip(pending_indices, cache_keys, preprocessed):
+                if isinstance(result, Exception):
+                    embeddings[i] = {
+                        "id": request.items[i].id,
+                        "embedding": None,
+                        "success": False,
+                        "error": str(result)
+                    }
+                else:
+                    image_tensors.append(result)
+                    tensor_keys.append(key)
+                    batch_indices.append(i)
+            
+            batch_embeddings = await run_model(embedding_service.encode_batch_images, image_tensors) if image_tensors else []
+            
+            if batch_embeddings:
+                await loop.run_in_executor(
+                    None, embedding_service.save_cached_image_embeddings, tensor_keys, batch_embeddings
+                )
+        
+        # Splice batch results back in original item order
+        for i, embedding in zip(batch_indices, batch_embeddings):
+            embeddings[i] = {
+                "id": request.items[i].id,
+                **serialize_embedding(embedding, request.format),
+                "success": True,
+                "error": None
+            }
+        
+        successful = sum(1 for e in embeddings if e["success"])
+        failed = len(request.items) - successful
         
         # Update metrics
         request_counter += successful
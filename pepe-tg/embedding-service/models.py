@@ -7,6 +7,12 @@ from typing import List, Optional, Literal
 from pydantic import BaseModel, Field
 
 
+# Embedding serialization format:
+# - 'json': list of float32 values in `embedding`
+# - 'f16_b64': base64-encoded little-endian float16 bytes in `embedding_b64`
+EmbeddingFormat = Literal["json", "f16_b64"]
+
+
 # =============================================================================
 # REQUEST MODELS
 # =============================================================================
@@ -23,6 +29,10 @@ class TextEmbeddingRequest(BaseModel):
         default="raw",
         description="Prompt template: 'visual' for style emphasis, 'content' for theme emphasis, 'raw' for as-is"
     )
+    format: EmbeddingFormat = Field(
+        default="json",
+        description="Response format: 'json' float list or 'f16_b64' base64 float16 bytes"
+    )
 
 
 class BatchItem(BaseModel):
@@ -43,6 +53,10 @@ class BatchEmbeddingRequest(BaseModel):
         max_items=100,
         description="List of items to embed (max 100 per batch)"
     )
+    format: EmbeddingFormat = Field(
+        default="json",
+        description="Response format: 'json' float list or 'f16_b64' base64 float16 bytes"
+    )
 
 
 # =============================================================================
@@ -51,11 +65,15 @@ class BatchEmbeddingRequest(BaseModel):
 
 class TextEmbeddingResponse(BaseModel):
     """Response schema for /embed/text endpoint"""
-    embedding: List[float] = Field(
-        ...,
+    embedding: Optional[List[float]] = Field(
+        None,
         min_items=512,
         max_items=512,
-        description="512-dimensional CLIP embedding vector"
+        description="512-dimensional CLIP embedding vector (format='json')"
+    )
+    embedding_b64: Optional[str] = Field(
+        None,
+        description="Base64-encoded float16 embedding (format='f16_b64')"
     )
     model: str = Field(
         ...,
@@ -73,11 +91,15 @@ class TextEmbeddingResponse(BaseModel):
 
 class ImageEmbeddingResponse(BaseModel):
     """Response schema for /embed/image endpoint"""
-    embedding: List[float] = Field(
-        ...,
+    embedding: Optional[List[float]] = Field(
+        None,
         min_items=512,
         max_items=512,
-        description="512-dimensional CLIP embedding vector"
+        description="512-dimensional CLIP embedding vector (format='json')"
+    )
+    embedding_b64: Optional[str] = Field(
+        None,
+        description="Base64-encoded float16 embedding (format='f16_b64')"
     )
     model: str = Field(
         ...,
@@ -93,6 +115,7 @@ class BatchEmbeddingItem(BaseModel):
     """Single embedding result in batch response"""
     id: Optional[str] = None
     embedding: Optional[List[float]] = None
+    embedding_b64: Optional[str] = None
     success: bool
     error: Optional[str] = None
 
@@ -3,136 +3,258 @@
 Split large Telegram export JSON into smaller, cleaned chunks.
 Extracts only: from, from_id, text, date
 Filters out service messages and empty text.
+
+Streams the messages array (pip install ijson orjson), so memory stays bounded
+by one chunk regardless of export size.
+
+Each chunk file is newline-delimited JSON: the first line holds the chunk
+metadata, followed by one message object per line. Read with:
+    header, *messages = (json.loads(line) for line in f)
+
+The cleaning loop is plain dict/str code and runs several times faster under
+PyPy (pypy3 split_telegram_history.py). orjson has no PyPy build, so the
+stdlib json encoder is used when it isn't installed.
 """
 
-import json
+import os
 import sys
+import queue
+import ijson
+import threading
 from pathlib import Path
 from datetime import datetime
 
+try:
+    from orjson import dumps
+except ImportError:
+    import json
+    
+    def dumps(obj):
+        """Serialize to compact UTF-8 JSON bytes."""
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
 # Configuration
 INPUT_FILE = "result.json"
 OUTPUT_DIR = "pepe-tg/docs/chunks"
 MESSAGES_PER_CHUNK = 500  # Smaller chunks to avoid rate limits
-FIELDS_TO_KEEP = ["from", "from_id", "text", "date"]
+READ_BUFFER_SIZE = 1 << 20  # 1 MiB per parser read (ijson defaults to 64 KiB)
+WRITE_BUFFER_SIZE = 1 << 20  # 1 MiB
+RAW_SLICE_SIZE = MESSAGES_PER_CHUNK * 4  # Raw messages cleaned per batch (many get filtered)
+PROGRESS_INTERVAL = 100000  # Messages between progress lines
+WRITE_QUEUE_SIZE = 4  # Serialized chunks waiting for the writer thread (caps memory)
+
+def _flatten(parts):
+    """Join a Telegram text array (plain strings and entity dicts) into one string."""
+    if len(parts) == 1 and isinstance(parts[0], str):
+        return parts[0]
+    return "".join(part if isinstance(part, str) else part.get("text", "") for part in parts)
 
 def clean_message(msg):
-    """Extract only the fields we want to keep."""
-    cleaned = {}
+    """Extract only from, from_id, text and date (service messages are filtered by the caller)."""
+    text = msg.get("text")
+    
+    # Handle text field - can be string or array
+    if isinstance(text, list):
+        text = _flatten(text)
     
-    # Skip service messages
-    if msg.get("type") == "service":
+    # Skip messages with no text (isspace() checks without allocating a stripped copy)
+    if not text or text.isspace():
         return None
     
-    # Extract fields
-    for field in FIELDS_TO_KEEP:
-        if field in msg:
-            value = msg[field]
-            
-            # Handle text field - can be string or array
-            if field == "text":
-                if isinstance(value, list):
-                    # Join text parts
-                    text_parts = []
-                    for part in value:
-                        if isinstance(part, str):
-                            text_parts.append(part)
-                        elif isinstance(part, dict) and "text" in part:
-                            text_parts.append(part["text"])
-                    value = "".join(text_parts)
-                
-                # Skip messages with no text
-                if not value or not value.strip():
-                    return None
-            
-            cleaned[field] = value
+    return {
+        "from": msg.get("from"),
+        "from_id": msg.get("from_id"),
+        "text": text,
+        "date": msg.get("date")
+    }
+
+def clean_slice(raw_messages):
+    """
+    Clean a slice of raw messages and serialize the kept ones as NDJSON lines.
+    Returns (lines, messages_seen, skipped_service, skipped_no_text).
+    """
+    lines = []
+    skipped_service = 0
+    skipped_no_text = 0
+    
+    for msg in raw_messages:
+        if msg.get("type") == "service":
+            skipped_service += 1
+            continue
+        
+        cleaned = clean_message(msg)
+        if not cleaned:
+            skipped_no_text += 1
+            continue
+        
+        lines.append(dumps(cleaned) + b"\n")
+    
+    return lines, len(raw_messages), skipped_service, skipped_no_text
+
+def iter_slices(items, size):
+    """Group a stream of items into lists of at most `size`."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def read_chat_header(input_file):
+    """Read the top-level chat fields (name, type, id) that precede the messages array."""
+    header = {}
+    
+    with open(input_file, 'rb', buffering=READ_BUFFER_SIZE) as f:
+        for prefix, event, value in ijson.parse(f, buf_size=READ_BUFFER_SIZE):
+            if prefix == "messages":
+                break
+            if prefix in ("name", "type", "id") and event in ("string", "number"):
+                header[prefix] = value
+    
+    return header
+
+def _chunk_writer(write_queue, errors):
+    """Write (path, data, message_count) items from the queue until a None sentinel.
+    After a failure, keeps draining so the producer never blocks on a full queue."""
+    while (item := write_queue.get()) is not None:
+        if errors:
+            continue
+        
+        output_file, data, message_count = item
+        try:
+            with open(output_file, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+                f.write(data)
+        except OSError as e:
+            errors.append(e)
+            continue
+        
+        print(f"  Created {output_file.name} ({message_count:,} messages)")
+
+def chunk_meta_prefix(header):
+    """Serialize the chat fields shared by every chunk's metadata line once,
+    as an unterminated JSON object for _write_chunk to complete."""
+    return dumps({
+        "chat_name": header.get("name", "Unknown"),
+        "chat_type": header.get("type", "unknown"),
+        "chat_id": header.get("id")
+    })[:-1]
+
+CHUNK_META_SUFFIX = b',"chunk_number":%d,"messages_in_chunk":%d,"message_range":{"start":%d,"end":%d}}\n'
+
+def _write_chunk(write_queue, chunk, chunk_number, start_idx, meta_prefix, output_path):
+    """Serialize one chunk as NDJSON (a metadata line, then the pre-serialized
+    message lines) and hand it to the writer thread. Returns its size in bytes."""
+    meta_line = meta_prefix + CHUNK_META_SUFFIX % (
+        chunk_number, len(chunk), start_idx + 1, start_idx + len(chunk)
+    )
     
-    # Only return if we have text
-    if "text" in cleaned and cleaned["text"]:
-        return cleaned
+    output_file = output_path / f"messages_chunk_{chunk_number:04d}.json"
+    data = meta_line + b"".join(chunk)
     
-    return None
+    write_queue.put((output_file, data, len(chunk)))
+    return len(data)
 
 def split_messages(input_file, output_dir, chunk_size):
-    """Split messages into chunks and save to separate files."""
+    """Stream messages from the export, clean them and save chunks as they fill."""
     print(f"Reading {input_file}...")
     
+    # The pure-Python ijson backends are an order of magnitude slower than the
+    # yajl2 C extension (CPython) or its cffi binding (PyPy)
+    if ijson.backend not in ("yajl2_c", "yajl2_cffi"):
+        print(f"Warning: ijson is using the slow '{ijson.backend}' backend "
+              f"(install yajl2 and reinstall ijson for the C backend)")
+    
     try:
-        with open(input_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        header = read_chat_header(input_file)
     except Exception as e:
         print(f"Error reading file: {e}")
         return
     
-    messages = data.get("messages", [])
-    total_messages = len(messages)
-    print(f"Total messages in export: {total_messages:,}")
+    meta_prefix = chunk_meta_prefix(header)
     
     # Create output directory
     output_path = Path(output_dir)
     output_path.mkdir(parents=True, exist_ok=True)
     
     # Process messages
-    cleaned_messages = []
+    total_messages = 0
+    total_cleaned = 0
+    num_chunks = 0
     skipped_service = 0
     skipped_no_text = 0
+    total_output_size = 0
+    buffer = []
+    next_report = PROGRESS_INTERVAL
     
-    print("Cleaning messages...")
-    for i, msg in enumerate(messages):
-        if i % 100000 == 0 and i > 0:
-            print(f"  Processed {i:,}/{total_messages:,} messages...")
-        
-        if msg.get("type") == "service":
-            skipped_service += 1
-            continue
+    print(f"Cleaning and splitting into chunks of ~{chunk_size:,} messages each...")
+    
+    # Chunk files are written on a separate thread so disk I/O overlaps with
+    # parsing/serializing the next chunk (write() releases the GIL)
+    write_queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+    write_errors = []
+    writer = threading.Thread(target=_chunk_writer, args=(write_queue, write_errors))
+    writer.start()
+    
+    try:
+        try:
+            with open(input_file, 'rb', buffering=READ_BUFFER_SIZE) as f:
+                # Hint the kernel to use a larger read-ahead window. (WILLNEED
+                # would pull the whole export into the page cache up front.)
+                if hasattr(os, "posix_fadvise"):
+                    os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                
+                messages = ijson.items(f, "messages.item", buf_size=READ_BUFFER_SIZE)
+                slices = iter_slices(messages, RAW_SLICE_SIZE)
+                
+                # Clean each slice, then cut the kept lines into fixed-size chunks
+                for lines, seen, slice_service, slice_no_text in map(clean_slice, slices):
+                    total_messages += seen
+                    if total_messages >= next_report:
+                        # stdout is block-buffered; flush so progress shows up live
+                        print(f"  Processed {total_messages:,} messages...", flush=True)
+                        next_report = (total_messages // PROGRESS_INTERVAL + 1) * PROGRESS_INTERVAL
+                    skipped_service += slice_service
+                    skipped_no_text += slice_no_text
+                    
+                    buffer.extend(lines)
+                    while len(buffer) >= chunk_size:
+                        num_chunks += 1
+                        total_output_size += _write_chunk(
+                            write_queue, buffer[:chunk_size], num_chunks, total_cleaned,
+                            meta_prefix, output_path
+                        )
+                        total_cleaned += chunk_size
+                        buffer = buffer[chunk_size:]
+        except (OSError, ijson.JSONError) as e:
+            print(f"Error reading file: {e}")
+            return
         
-        cleaned = clean_message(msg)
-        if cleaned:
-            cleaned_messages.append(cleaned)
-        else:
-            skipped_no_text += 1
+        # Flush the last partial chunk
+        if buffer:
+            num_chunks += 1
+            total_output_size += _write_chunk(
+                write_queue, buffer, num_chunks, total_cleaned, meta_prefix, output_path
+            )
+            total_cleaned += len(buffer)
+    finally:
+        write_queue.put(None)
+        writer.join()
+    
+    if write_errors:
+        print(f"Error writing chunks: {write_errors[0]}")
+        return
     
-    total_cleaned = len(cleaned_messages)
     print(f"\nCleaning complete:")
-    print(f"  - Kept: {total_cleaned:,} messages")
+    print(f"  - Total messages in export: {total_messages:,}")
+    print(f"  - Kept: {total_cleaned:,} messages in {num_chunks} chunks")
     print(f"  - Skipped service messages: {skipped_service:,}")
     print(f"  - Skipped empty/no text: {skipped_no_text:,}")
     print(f"  - Reduction: {(1 - total_cleaned/total_messages)*100:.1f}%")
     
-    # Split into chunks
-    num_chunks = (total_cleaned + chunk_size - 1) // chunk_size
-    print(f"\nSplitting into {num_chunks} chunks of ~{chunk_size:,} messages each...")
-    
-    for i in range(num_chunks):
-        start_idx = i * chunk_size
-        end_idx = min((i + 1) * chunk_size, total_cleaned)
-        chunk = cleaned_messages[start_idx:end_idx]
-        
-        # Create chunk metadata
-        chunk_data = {
-            "chat_name": data.get("name", "Unknown"),
-            "chat_type": data.get("type", "unknown"),
-            "chat_id": data.get("id"),
-            "chunk_number": i + 1,
-            "total_chunks": num_chunks,
-            "messages_in_chunk": len(chunk),
-            "message_range": {
-                "start": start_idx + 1,
-                "end": end_idx
-            },
-            "messages": chunk
-        }
-        
-        # Save chunk
-        output_file = output_path / f"messages_chunk_{i+1:04d}.json"
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(chunk_data, f, ensure_ascii=False, indent=2)
-        
-        print(f"  Created {output_file.name} ({len(chunk):,} messages)")
-    
     # Calculate size reduction
     original_size = Path(input_file).stat().st_size
-    total_output_size = sum(f.stat().st_size for f in output_path.glob("*.json"))
     
     print(f"\nSize comparison:")
     print(f"  - Original: {original_size / (1024*1024):.1f} MB")
@@ -141,5 +263,8 @@ def split_messages(input_file, output_dir, chunk_size):
     print(f"\nDone! Output files in: {output_dir}")
 
 if __name__ == "__main__":
+    # One "Created" line per chunk adds up; batch them instead of flushing each line
+    if hasattr(sys.stdout, "reconfigure"):
+        sys.stdout.reconfigure(line_buffering=False)
     split_messages(INPUT_FILE, OUTPUT_DIR, MESSAGES_PER_CHUNK)
 